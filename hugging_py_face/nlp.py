@@ -1,28 +1,107 @@
-import json
+import gzip
 import time
-import requests
+import asyncio
+import hashlib
+import httpx
+import numpy as np
+from collections import OrderedDict
+
+def _np_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError
+
+
+try:
+    import orjson as _json
+
+    # orjson emits compact UTF-8 bytes natively and serializes numeric ndarrays without a copy
+    def _dumps(obj):
+        return _json.dumps(obj, option=_json.OPT_SERIALIZE_NUMPY, default=_np_default)
+
+    def _canonical_dumps(obj):
+        return _json.dumps(obj, option=_json.OPT_SORT_KEYS | _json.OPT_SERIALIZE_NUMPY, default=_np_default)
+except ImportError:
+    try:
+        import ujson as _json
+
+        def _dumps(obj):
+            return _json.dumps(obj, ensure_ascii=False, default=_np_default).encode()
+    except ImportError:
+        import json as _json
+
+        def _dumps(obj):
+            return _json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_np_default).encode()
+
+    def _canonical_dumps(obj):
+        return _json.dumps(obj, sort_keys=True, default=_np_default).encode()
 import pandas as pd
 from pandas import DataFrame
-from typing import Text, List, Dict, Optional, Union
+from typing import Text, List, Dict, Optional, Tuple, Union
 
 from .base_api import BaseAPI
 from .exceptions import HTTPServiceUnavailableException, APICallException, InsufficientParametersException
 
 
+# how the _in_df methods pull the predictions column out of each task's response:
+# 'key' is the field holding the prediction and 'nested' marks tasks that return
+# a list of ranked candidates per input, of which the first is taken
+_TASKS = {
+    'fill-mask': {'key': 'sequence', 'nested': True},
+    'summarization': {'key': 'summary_text', 'nested': False},
+    'text-classification': {'key': 'label', 'nested': True},
+    'text-generation': {'key': 'generated_text', 'nested': True},
+    'translation': {'key': 'translation_text', 'nested': False},
+}
+
+
 class NLP(BaseAPI):
-    def __init__(self, api_token: Text, api_url: Optional[Text] = None):
+    def __init__(self, api_token: Text, api_url: Optional[Text] = None, cache_size: int = 1024):
         super().__init__(api_token, api_url)
 
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+        self._auth_header = f"Bearer {api_token}"
+        self._task_urls = {task: f"{self.api_url}/{model}" for task, model in self.config['TASK_MODEL_MAP'].items()}
+        self._model_urls = {}
+
+        self._client = httpx.Client(http2=True, headers={"Authorization": self._auth_header}, timeout=60)
+
+    def close(self) -> None:
+        """
+        Close the underlying HTTP connection pool. The instance cannot be used for further queries afterwards.
+        """
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _resolve_url(self, model: Optional[Text], task: Optional[Text]) -> Text:
+        if model is None:
+            return self._task_urls[task]
+
+        api_url = self._model_urls.get(model)
+        if api_url is None:
+            api_url = self._model_urls[model] = f"{self.api_url}/{model}"
+        return api_url
+
+    def _prepare_body(self, data: Dict) -> Tuple[bytes, Optional[Dict]]:
+        # compresslevel=1 is much faster than the default and still shrinks text severalfold
+        body = _dumps(data)
+        if len(body) >= self.config['GZIP_MIN_BYTES']:
+            return gzip.compress(body, compresslevel=1), {"Content-Encoding": "gzip"}
+        return body, None
+
     def _query(self, inputs: Union[Text, List, Dict], parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, task: Optional[Text] = None) -> Union[Dict, List]:
 
         if model and not task.startswith('translation_'):  # don't check variations of translation
             self._check_model_task_match(model, task)
 
-        api_url = f"{self.api_url}/{model if model is not None else self.config['TASK_MODEL_MAP'][task]}"
-
-        headers = {
-            "Authorization": f"Bearer {self.api_token}"
-        }
+        api_url = self._resolve_url(model, task)
 
         data = {
             "inputs": inputs
@@ -34,29 +113,137 @@ class NLP(BaseAPI):
         if options is not None:
             data['options'] = options
 
+        cache_key = None
+        # options={"use_cache": False} is the documented escape hatch for forcing fresh
+        # inference from non-deterministic models; it must bypass the client cache too
+        if self._cache_size and (options is None or options.get('use_cache') is not False):
+            cache_key = hashlib.blake2b(_canonical_dumps([task, model, inputs, parameters, options])).digest()
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+
+        body, headers = self._prepare_body(data)
+
         retries = 0
 
         while retries < self.config['MAX_RETRIES']:
             retries += 1
 
-            response = requests.request("POST", api_url, headers=headers, data=json.dumps(data))
+            response = self._client.post(api_url, content=body, headers=headers)
             if response.status_code == int(self.config['HTTP_SERVICE_UNAVAILABLE']):
                 self.logger.info(f"Status code: {response.status_code}.")
                 self.logger.info("Retrying..")
                 time.sleep(1)
             elif response.status_code == 200:
-                return json.loads(response.content.decode("utf-8"))
+                result = _json.loads(response.content)
+                if cache_key is not None:
+                    self._cache[cache_key] = result
+                    if len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+                return result
             else:
                 self.logger.info(f"Status code: {response.status_code}.")
                 raise APICallException(f"API call failed with status code {response.status_code}.")
 
         self.logger.info(f"Status code: {response.status_code}.")
         self.logger.info("Connection to the server failed after reaching maximum retry attempts.")
-        self.logger.debug(f"Response: {json.loads(response.content.decode('utf-8'))}.")
+        self.logger.debug(f"Response: {_json.loads(response.content)}.")
         raise HTTPServiceUnavailableException("The HTTP service is unavailable.")
 
-    def _query_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, task: Optional[Text] = None) -> Union[Dict, List]:
-        return self._query(df[column].tolist(), parameters, options, model, task)
+    @staticmethod
+    def _extract_predictions(task: Text, predictions: List) -> np.ndarray:
+        key = _TASKS[task]['key']
+        if _TASKS[task]['nested']:
+            return np.fromiter((prediction[0][key] for prediction in predictions), dtype=object, count=len(predictions))
+        return pd.json_normalize(predictions)[key].to_numpy()
+
+    def _query_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, task: Optional[Text] = None, n_chunks: Optional[int] = None) -> Union[Dict, List]:
+        values = df[column].to_numpy()
+
+        inputs = values
+        inverse = None
+        # deduplication is a form of caching within the batch, so use_cache=False must
+        # disable it too: sampling models should see every row, duplicated or not
+        if options is None or options.get('use_cache') is not False:
+            try:
+                uniq, inv = np.unique(values, return_inverse=True)
+            except TypeError:
+                # columns mixing strings with NaN/None (or other incomparable types) can't be
+                # sorted for deduplication; send them as-is like before
+                pass
+            else:
+                if len(uniq) < len(values):
+                    inputs, inverse = uniq, inv
+
+        if n_chunks is not None and n_chunks > 1:
+            predictions = self._query_concurrent(inputs, parameters, options, model, task, n_chunks)
+        else:
+            predictions = self._query(inputs, parameters, options, model, task)
+
+        if inverse is None:
+            return predictions
+
+        fanned_out = np.empty(len(predictions), dtype=object)
+        fanned_out[:] = predictions
+        return fanned_out[inverse].tolist()
+
+    async def _post_chunk(self, client: httpx.AsyncClient, api_url: Text, data: Dict) -> Union[Dict, List]:
+        body, headers = self._prepare_body(data)
+
+        retries = 0
+
+        while retries < self.config['MAX_RETRIES']:
+            retries += 1
+
+            response = await client.post(api_url, content=body, headers=headers)
+            if response.status_code == int(self.config['HTTP_SERVICE_UNAVAILABLE']):
+                self.logger.info(f"Status code: {response.status_code}.")
+                self.logger.info("Retrying..")
+                await asyncio.sleep(1)
+            elif response.status_code == 200:
+                return _json.loads(response.content)
+            else:
+                self.logger.info(f"Status code: {response.status_code}.")
+                raise APICallException(f"API call failed with status code {response.status_code}.")
+
+        self.logger.info(f"Status code: {response.status_code}.")
+        self.logger.info("Connection to the server failed after reaching maximum retry attempts.")
+        raise HTTPServiceUnavailableException("The HTTP service is unavailable.")
+
+    async def _query_async(self, inputs: Union[List, np.ndarray], parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, task: Optional[Text] = None, n_chunks: int = 4) -> List:
+        if model and not task.startswith('translation_'):  # don't check variations of translation
+            self._check_model_task_match(model, task)
+
+        api_url = self._resolve_url(model, task)
+
+        n_chunks = max(1, min(n_chunks, len(inputs)))
+        chunk_size = -(-len(inputs) // n_chunks)
+        chunks = [inputs[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+
+        payloads = []
+        for chunk in chunks:
+            data = {
+                "inputs": chunk
+            }
+
+            if parameters is not None:
+                data['parameters'] = parameters
+
+            if options is not None:
+                data['options'] = options
+
+            payloads.append(data)
+
+        async with httpx.AsyncClient(http2=True, headers={"Authorization": self._auth_header}, timeout=60) as client:
+            results = await asyncio.gather(*[self._post_chunk(client, api_url, payload) for payload in payloads])
+
+        predictions = []
+        for result in results:
+            predictions.extend(result)
+        return predictions
+
+    def _query_concurrent(self, inputs: Union[List, np.ndarray], parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, task: Optional[Text] = None, n_chunks: int = 4) -> List:
+        return asyncio.run(self._query_async(inputs, parameters, options, model, task, n_chunks))
 
     def fill_mask(self, text: Union[Text, List], options: Optional[Dict] = None, model: Optional[Text] = None) -> List:
         """
@@ -69,7 +256,7 @@ class NLP(BaseAPI):
         """
         return self._query(text, options=options, model=model, task='fill-mask')
 
-    def fill_mask_in_df(self, df: DataFrame, column: Text, options: Optional[Dict] = None, model: Optional[Text] = None) -> DataFrame:
+    def fill_mask_in_df(self, df: DataFrame, column: Text, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None) -> DataFrame:
         """
         Fill in the masked portion(token) of a column of strings in a DataFrame.
 
@@ -77,12 +264,13 @@ class NLP(BaseAPI):
         :param column: the column containing the strings to be filled.
         :param options: a dict of options. For more information, see the `detailed parameters for the fill mask task <https://huggingface.co/docs/api-inference/detailed_parameters#fill-mask-task>`_.
         :param model: the model to use for the fill mask task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the completions for the masked strings. Each completion added will be the one with the highest probability for that particular masked string. The completions will be added as a new column called 'predictions' to the original DataFrame.
         """
-        predictions = self._query_in_df(df, column, options=options, model=model, task='fill-mask')
+        predictions = self._query_in_df(df, column, options=options, model=model, task='fill-mask', n_chunks=n_chunks)
 
         if any(isinstance(prediction, list) for prediction in predictions):
-            df['predictions'] = [prediction[0]['sequence'] for prediction in predictions]
+            df['predictions'] = self._extract_predictions('fill-mask', predictions)
         else:
             df['predictions'] = [predictions[0]['sequence']]
 
@@ -100,7 +288,7 @@ class NLP(BaseAPI):
         """
         return self._query(text, parameters=parameters, options=options, model=model, task='summarization')
 
-    def summarization_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> DataFrame:
+    def summarization_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None) -> DataFrame:
         """
         Summarize a column of strings in a DataFrame.
 
@@ -109,10 +297,11 @@ class NLP(BaseAPI):
         :param parameters: a dict of parameters. For more information, see the `detailed parameters for the summarization task <https://huggingface.co/docs/api-inference/detailed_parameters#summarization-task>`_.
         :param options: a dict of options. For more information, see the `detailed parameters for the summarization task <https://huggingface.co/docs/api-inference/detailed_parameters#summarization-task>`_.
         :param model: the model to use for the summarization task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the summarizations for the strings. The summarizations will be added as a new column called 'predictions' to the original DataFrame.
         """
-        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='summarization')
-        df['predictions'] = [prediction['summary_text'] for prediction in predictions]
+        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='summarization', n_chunks=n_chunks)
+        df['predictions'] = self._extract_predictions('summarization', predictions)
         return df
 
     def question_answering(self, question: Text, context: Text, model: Optional[Text] = None) -> Dict:
@@ -251,7 +440,7 @@ class NLP(BaseAPI):
         """
         return self._query(text, options=options, model=model, task='text-classification')
 
-    def text_classification_in_df(self, df: DataFrame, column: Text, options: Optional[Dict] = None, model: Optional[Text] = None) -> DataFrame:
+    def text_classification_in_df(self, df: DataFrame, column: Text, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None) -> DataFrame:
         """
         Analyze the sentiment of a column of strings in a DataFrame.
 
@@ -259,10 +448,11 @@ class NLP(BaseAPI):
         :param column: the column containing the strings to be analyzed.
         :param options: a dict of options. For more information, see the `detailed parameters for the summarization task <https://huggingface.co/docs/api-inference/detailed_parameters#text-classification-task>`_.
         :param model: the model to use for the text classification task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the sentiment of the strings. Each sentiment added will be the one with the highest probability for that particular string. The sentiment will be added as a new column called 'predictions' to the original DataFrame.
         """
-        predictions = self._query_in_df(df, column, options=options, model=model, task='text-classification')
-        df['predictions'] = [prediction[0]['label'] for prediction in predictions]
+        predictions = self._query_in_df(df, column, options=options, model=model, task='text-classification', n_chunks=n_chunks)
+        df['predictions'] = self._extract_predictions('text-classification', predictions)
         return df
 
     def text_generation(self, text: Union[Text, List], parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> Union[Dict, List]:
@@ -277,7 +467,7 @@ class NLP(BaseAPI):
         """
         return self._query(text, parameters=parameters, options=options, model=model, task='text-generation')
 
-    def text_generation_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> DataFrame:
+    def text_generation_in_df(self, df: DataFrame, column: Text, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None) -> DataFrame:
         """
         Continue text from a prompt in the column of a DataFrame.
 
@@ -286,13 +476,14 @@ class NLP(BaseAPI):
         :param parameters: a dict of parameters. For more information, see the `detailed parameters for the text generation task <https://huggingface.co/docs/api-inference/detailed_parameters#text-generation-task>`_.
         :param options: a dict of options. For more information, see the `detailed parameters for the text generation task <https://huggingface.co/docs/api-inference/detailed_parameters#text-generation-task>`_.
         :param model: the model to use for the text generation task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the generated text. The generated text will be added as a new column called 'predictions' to the original DataFrame.
         """
-        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='text-generation')
-        df['predictions'] = [prediction[0]['generated_text'] for prediction in predictions]
+        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='text-generation', n_chunks=n_chunks)
+        df['predictions'] = self._extract_predictions('text-generation', predictions)
         return df
 
-    def zero_shot_classification(self, text: Union[Text, List], candidate_labels: List, parameters: Optional[Dict] = {}, options: Optional[Dict] = None, model: Optional[Text] = None) -> Union[Dict, List]:
+    def zero_shot_classification(self, text: Union[Text, List], candidate_labels: List, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> Union[Dict, List]:
         """
         Classify a sentence/paragraph to one of the candidate labels provided.
 
@@ -303,6 +494,7 @@ class NLP(BaseAPI):
         :param model: the model to use for the zero shot classification task. If not provided, the recommended model from Hugging Face will be used.
         :return: a dict or a list of dicts containing the labels and the corresponding the probability of each label.
         """
+        parameters = dict(parameters) if parameters else {}
         parameters['candidate_labels'] = candidate_labels
 
         return self._query(
@@ -313,7 +505,7 @@ class NLP(BaseAPI):
             task='zero-shot-classification'
         )
 
-    def zero_shot_classification_in_df(self, df: DataFrame, column: Text, candidate_labels: List, parameters: Optional[Dict] = {}, options: Optional[Dict] = None, model: Optional[Text] = None):
+    def zero_shot_classification_in_df(self, df: DataFrame, column: Text, candidate_labels: List, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None):
         """
 
         :param df: a pandas DataFrame containing the strings to be classified.
@@ -322,11 +514,13 @@ class NLP(BaseAPI):
         :param parameters: a dict of parameters excluding candidate_labels which is passed in as a separate argument. For more information, see the `detailed parameters for the zero shot classification task <https://huggingface.co/docs/api-inference/detailed_parameters#zeroshot-classification-task>`_.
         :param options: a dict of options. For more information, see the `detailed parameters for the zero shot classification task <https://huggingface.co/docs/api-inference/detailed_parameters#zeroshot-classification-task>`_.
         :param model: the model to use for the zero shot classification task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the classifications. The classifications will be added as a new column called 'predictions' to the original DataFrame.
         """
+        parameters = dict(parameters) if parameters else {}
         parameters['candidate_labels'] = candidate_labels
-        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='zero-shot-classification')
-        df['predictions'] = [prediction['labels'][0] for prediction in predictions]
+        predictions = self._query_in_df(df, column, parameters=parameters, options=options, model=model, task='zero-shot-classification', n_chunks=n_chunks)
+        df['predictions'] = np.fromiter((prediction['labels'][0] for prediction in predictions), dtype=object, count=len(predictions))
         return df
 
     def conversational(self, text: Union[Text, List], past_user_inputs: Optional[List] = None, generated_responses: Optional[List] = None, parameters: Optional[Dict] = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> Union[Dict, List]:
@@ -370,6 +564,21 @@ class NLP(BaseAPI):
         """
         return self._query(text, options=options, model=model, task='feature-extraction')
 
+    def feature_extraction_np(self, text: Union[Text, List], options: Optional[Dict] = None, model: Optional[Text] = None) -> np.ndarray:
+        """
+        Reads some text and outputs the features as a NumPy array of float32 values.
+
+        Compared to :meth:`feature_extraction`, this avoids materializing one Python float object per
+        embedding dimension and returns a single contiguous buffer that downstream vector math
+        (cosine similarity, dot products) can operate on directly.
+
+        :param text: a string or a list of strings to get the features from.
+        :param options: a dict of options. For more information, see the `detailed parameters for the feature extraction task <https://huggingface.co/docs/api-inference/detailed_parameters#feature-extraction-task>`_.
+        :param model: the model to use for the feature extraction task. If not provided, the recommended model from Hugging Face will be used.
+        :return: a numpy ndarray of dtype float32 containing the representation of the features of the input(s).
+        """
+        return np.asarray(self._query(text, options=options, model=model, task='feature-extraction'), dtype=np.float32)
+
     def translation(self, text: Union[Text, List], lang_input: Text = None, lang_output: Text = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> Union[Dict, List]:
         """
         Translates text from one language to another.
@@ -389,7 +598,7 @@ class NLP(BaseAPI):
         else:
             return self._query(text, options=options, model=model, task='translation')
 
-    def translation_in_df(self, df: DataFrame, column: Text, lang_input: Text = None, lang_output: Text = None, options: Optional[Dict] = None, model: Optional[Text] = None) -> DataFrame:
+    def translation_in_df(self, df: DataFrame, column: Text, lang_input: Text = None, lang_output: Text = None, options: Optional[Dict] = None, model: Optional[Text] = None, n_chunks: Optional[int] = None) -> DataFrame:
         """
         Translates text from one language to another.
 
@@ -399,6 +608,7 @@ class NLP(BaseAPI):
         :param lang_output: the short code of the language to translate the input text to. This parameter is mandatory if the model is not provided.
         :param options: a dict of options. For more information, see the `detailed parameters for the translation task <https://huggingface.co/docs/api-inference/detailed_parameters#translation-task>`_.
         :param model: the model to use for the translation task. If not provided, the recommended model from Hugging Face will be used.
+        :param n_chunks: if provided and greater than 1, the inputs are split into this many chunks which are posted concurrently over HTTP/2.
         :return: a pandas DataFrame with the translations. The translations will be added as a new column called 'predictions' to the original DataFrame.
         """
         if model is None:
@@ -410,7 +620,7 @@ class NLP(BaseAPI):
         if lang_input is not None and lang_output is not None:
             task = f"translation_{lang_input}_to_{lang_output}"
 
-        predictions = self._query_in_df(df, column, options=options, model=model, task=task)
+        predictions = self._query_in_df(df, column, options=options, model=model, task=task, n_chunks=n_chunks)
 
-        df['predictions'] = [prediction['translation_text'] for prediction in predictions]
+        df['predictions'] = self._extract_predictions('translation', predictions)
         return df
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import unittest
+import numpy as np
 from dotenv import load_dotenv
 
 from hugging_py_face.nlp import NLP
@@ -136,13 +137,11 @@ class TestNLP(unittest.TestCase):
         source_sentence = "That is a happy person"
         sentences = ["That is a happy dog", "That is a very happy person", "Today is a sunny day"]
 
-        def assert_almost_equal_list(expected, actual, decimal_places=3):
+        def assert_almost_equal_list(expected, actual, places=3):
             self.assertEqual(len(expected), len(actual), "List lengths are different.")
 
             for exp, act in zip(expected, actual):
-                exp_str = "{:.{}f}".format(exp, decimal_places)
-                act_str = "{:.{}f}".format(act, decimal_places)
-                self.assertEqual(exp_str, act_str, "Values are not approximately equal.")
+                self.assertAlmostEqual(exp, act, places=places, msg="Values are not approximately equal.")
 
         try:
             assert_almost_equal_list(
@@ -250,6 +249,16 @@ class TestNLP(unittest.TestCase):
         except HTTPServiceUnavailableException:
             pass
 
+    def test_feature_extraction_np(self):
+        text = "Transformers is an awesome library!"
+
+        try:
+            features = self.nlp.feature_extraction_np(text)
+            self.assertEqual(type(features), np.ndarray)
+            self.assertEqual(features.dtype, np.float32)
+        except HTTPServiceUnavailableException:
+            pass
+
     def test_translation(self):
         text = "I like to play football"
 
@@ -0,0 +1,151 @@
+import gzip
+import json
+import unittest
+import httpx
+import pandas as pd
+from unittest import mock
+
+from hugging_py_face.nlp import NLP
+
+
+class TestNLPClient(unittest.TestCase):
+    """Offline tests for the client-side query logic, with the HTTP client stubbed out."""
+
+    @staticmethod
+    def _response(payload):
+        return mock.Mock(status_code=200, content=json.dumps(payload).encode())
+
+    def setUp(self):
+        self.nlp = NLP("api-token")
+
+    def test_close_and_context_manager_release_the_client(self):
+        with NLP("api-token") as nlp:
+            self.assertFalse(nlp._client.is_closed)
+        self.assertTrue(nlp._client.is_closed)
+
+        nlp = NLP("api-token")
+        nlp.close()
+        self.assertTrue(nlp._client.is_closed)
+
+    def test_query_in_df_deduplicates_inputs(self):
+        texts = ["b", "a", "b", "a", "c"]
+        df = pd.DataFrame(texts, columns=['texts'])
+
+        responses = {
+            "a": [{"label": "A", "score": 0.9}],
+            "b": [{"label": "B", "score": 0.8}],
+            "c": [{"label": "C", "score": 0.7}],
+        }
+
+        def fake_post(url, content=None, headers=None):
+            inputs = json.loads(content)["inputs"]
+            self.assertEqual(inputs, ["a", "b", "c"], "Only the unique values should be sent.")
+            return self._response([responses[text] for text in inputs])
+
+        with mock.patch.object(self.nlp._client, "post", side_effect=fake_post) as post:
+            result = self.nlp.text_classification_in_df(df, 'texts')
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(result['predictions'].tolist(), ["B", "A", "B", "A", "C"])
+
+    def test_query_in_df_deduplicates_nested_predictions(self):
+        texts = ["m", "m", "n"]
+        df = pd.DataFrame(texts, columns=['texts'])
+
+        def fake_post(url, content=None, headers=None):
+            inputs = json.loads(content)["inputs"]
+            self.assertEqual(inputs, ["m", "n"])
+            return self._response([[{"sequence": f"{text} first"}, {"sequence": f"{text} second"}] for text in inputs])
+
+        with mock.patch.object(self.nlp._client, "post", side_effect=fake_post):
+            result = self.nlp.fill_mask_in_df(df, 'texts')
+
+        self.assertEqual(result['predictions'].tolist(), ["m first", "m first", "n first"])
+
+    def test_query_in_df_with_nulls_falls_back_to_sending_all_rows(self):
+        texts = ["a", None, "a"]
+        df = pd.DataFrame(texts, columns=['texts'])
+
+        def fake_post(url, content=None, headers=None):
+            inputs = json.loads(content)["inputs"]
+            self.assertEqual(inputs, texts, "Unsortable columns should be forwarded as-is.")
+            return self._response([[{"label": "X"}], [{"label": "Y"}], [{"label": "Z"}]])
+
+        with mock.patch.object(self.nlp._client, "post", side_effect=fake_post):
+            result = self.nlp.text_classification_in_df(df, 'texts')
+
+        self.assertEqual(result['predictions'].tolist(), ["X", "Y", "Z"])
+
+    def test_query_in_df_skips_deduplication_when_use_cache_is_false(self):
+        texts = ["repeat", "repeat", "repeat"]
+        df = pd.DataFrame(texts, columns=['texts'])
+
+        def fake_post(url, content=None, headers=None):
+            inputs = json.loads(content)["inputs"]
+            self.assertEqual(inputs, texts, "use_cache=False should send every row, duplicated or not.")
+            return self._response([[{"generated_text": f"{text} {index}"}] for index, text in enumerate(inputs)])
+
+        with mock.patch.object(self.nlp._client, "post", side_effect=fake_post):
+            result = self.nlp.text_generation_in_df(df, 'texts', options={"use_cache": False})
+
+        self.assertEqual(result['predictions'].tolist(), ["repeat 0", "repeat 1", "repeat 2"])
+
+    def test_query_in_df_concurrent_chunks_and_reassembles_in_order(self):
+        texts = ["a", "b", "c", "d", "e"]
+        df = pd.DataFrame(texts, columns=['texts'])
+
+        sent_chunks = []
+
+        async def fake_post(client, url, content=None, headers=None):
+            inputs = json.loads(content)["inputs"]
+            sent_chunks.append(inputs)
+            return mock.Mock(status_code=200, content=json.dumps([[{"label": text.upper()}] for text in inputs]).encode())
+
+        with mock.patch.object(httpx.AsyncClient, "post", fake_post):
+            result = self.nlp.text_classification_in_df(df, 'texts', n_chunks=2)
+
+        self.assertEqual(sent_chunks, [["a", "b", "c"], ["d", "e"]])
+        self.assertEqual(result['predictions'].tolist(), ["A", "B", "C", "D", "E"])
+
+    def test_query_cache_hits_and_eviction(self):
+        nlp = NLP("api-token", cache_size=2)
+
+        with mock.patch.object(nlp._client, "post", return_value=self._response([{"label": "POSITIVE", "score": 0.9}])) as post:
+            first = nlp.text_classification("x")
+            second = nlp.text_classification("x")
+            self.assertEqual(post.call_count, 1, "A repeated call should be served from the cache.")
+            self.assertEqual(first, second)
+
+            nlp.text_classification("y")
+            nlp.text_classification("z")  # evicts "x", the least recently used entry
+            nlp.text_classification("x")
+            self.assertEqual(post.call_count, 4)
+
+    def test_query_cache_disabled(self):
+        nlp = NLP("api-token", cache_size=0)
+
+        with mock.patch.object(nlp._client, "post", return_value=self._response([{"label": "POSITIVE", "score": 0.9}])) as post:
+            nlp.text_classification("x")
+            nlp.text_classification("x")
+            self.assertEqual(post.call_count, 2)
+
+    def test_query_cache_bypassed_when_use_cache_is_false(self):
+        with mock.patch.object(self.nlp._client, "post", return_value=self._response([{"generated_text": "text"}])) as post:
+            self.nlp.text_generation("text", options={"use_cache": False})
+            self.nlp.text_generation("text", options={"use_cache": False})
+            self.assertEqual(post.call_count, 2, "use_cache=False should bypass the client cache.")
+
+    def test_prepare_body_leaves_small_payloads_uncompressed(self):
+        body, headers = self.nlp._prepare_body({"inputs": "a short text"})
+
+        self.assertIsNone(headers)
+        self.assertEqual(json.loads(body), {"inputs": "a short text"})
+
+    def test_prepare_body_gzips_large_payloads(self):
+        text = "word " * 10000
+
+        body, headers = self.nlp._prepare_body({"inputs": text})
+
+        self.assertEqual(headers, {"Content-Encoding": "gzip"})
+        self.assertLess(len(body), self.nlp.config['GZIP_MIN_BYTES'])
+        self.assertEqual(json.loads(gzip.decompress(body)), {"inputs": text})